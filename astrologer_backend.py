@@ -1,15 +1,43 @@
-from flask import Flask, request, jsonify
+from flask import Flask, Response, request, stream_with_context
 from flask_cors import CORS
+import httpx
+import orjson
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 import os
+import uuid
+import re
+import tempfile
+import hashlib
+import atexit
 import logging
-from datetime import datetime
-from groq import Groq
+import queue
+import threading
+import time
+from logging.handlers import QueueHandler, QueueListener
+from collections import OrderedDict
+from concurrent.futures import Future, ThreadPoolExecutor
+from datetime import date
+from functools import lru_cache
+from typing import Annotated, Optional
+from diskcache import Cache
+from groq import (APIConnectionError, APIStatusError, BadRequestError, Groq, InternalServerError,
+                  RateLimitError)
+from pydantic import BaseModel, BeforeValidator, StringConstraints, ValidationError
 from dotenv import load_dotenv
 load_dotenv()
 
-# Configure logging
-logging.basicConfig(level=logging.INFO)
+# Configure logging; records are handed to a queue and written by a listener thread
+# so request threads never block on the stream handler's lock
+_log_queue = queue.Queue(-1)
+_log_handler = logging.StreamHandler()
+_log_handler.setFormatter(logging.Formatter(logging.BASIC_FORMAT))
+_log_listener = QueueListener(_log_queue, _log_handler)
+_log_listener.start()
+atexit.register(_log_listener.stop)
+logging.getLogger().addHandler(QueueHandler(_log_queue))
+logging.getLogger().setLevel(logging.INFO)
 logger = logging.getLogger(__name__)
 
 app = Flask(__name__)
@@ -19,114 +47,570 @@ CORS(app)
 TAVILY_API_KEY = os.getenv("TAVILY_API_KEY")
 GROQ_API_KEY = os.getenv("GROQ_API_KEY")
 
-# Groq client
-groq_client = Groq(api_key=GROQ_API_KEY)
+# Groq client; the SDK retries 429/5xx with exponential backoff and honors Retry-After.
+# The HTTP/2 client keeps idle connections alive so a warmed connection survives between requests.
+groq_client = Groq(
+    api_key=GROQ_API_KEY,
+    max_retries=int(os.getenv("GROQ_MAX_RETRIES", "4")),
+    http_client=httpx.Client(
+        http2=True,
+        timeout=httpx.Timeout(60.0, connect=5.0),
+        limits=httpx.Limits(max_connections=64, max_keepalive_connections=32, keepalive_expiry=300)
+    )
+)
+
+# Readings have a pre-written fallback, so they get a tight latency budget instead of the
+# default client's long timeout and retries; a slow Groq then falls back quickly
+GROQ_READING_TIMEOUT = float(os.getenv("GROQ_READING_TIMEOUT", "20"))
+_groq_reading_client = groq_client.with_options(
+    timeout=httpx.Timeout(GROQ_READING_TIMEOUT, connect=3.0), max_retries=1)
+
+# Calls slower than this (time to first token when streaming) count as breaker failures
+GROQ_SLOW_SECONDS = float(os.getenv("GROQ_SLOW_SECONDS", "10"))
+
+# Cap on concurrent Groq calls so request bursts queue locally instead of tripping provider rate limits
+_GROQ_SEM = threading.BoundedSemaphore(int(os.getenv("GROQ_MAX_CONCURRENCY", "8")))
+
+# Shared HTTP session so Tavily calls reuse pooled TCP/TLS connections
+_SESSION = requests.Session()
+_SESSION.headers.update({"Content-Type": "application/json"})
+_SESSION.mount("https://", HTTPAdapter(
+    pool_connections=32,
+    pool_maxsize=32,
+    max_retries=Retry(
+        total=2,
+        read=0,  # a read timeout already spent the full read budget; retrying would multiply it
+        backoff_factor=0.2,
+        status_forcelist=[429, 500, 502, 503, 504],
+        allowed_methods=frozenset({"POST"}),  # Tavily searches are idempotent
+        raise_on_status=False
+    )
+))
+
+# Tavily timeouts as (connect, read) so slow tail queries don't dominate
+TAVILY_TIMEOUT = (3, 10)
+
+# Worker pool for fanning out the independent Tavily queries (shared across requests);
+# its size is also the cap on concurrent Tavily calls
+_TAVILY_POOL = ThreadPoolExecutor(max_workers=int(os.getenv("TAVILY_MAX_CONCURRENCY", "12")),
+                                  thread_name_prefix="tavily")
+
+# Tavily results keyed by (query, include_answer); the generic zodiac queries repeat for every user of a sign.
+# Kept on disk so every worker process shares hits and they survive restarts.
+TAVILY_CACHE_TTL = 6 * 3600
+_TAVILY_CACHE = Cache(os.getenv("TAVILY_CACHE_DIR", os.path.join(tempfile.gettempdir(), "astrologer-tavily")),
+                      size_limit=64 * 1024 * 1024)
+atexit.register(_TAVILY_CACHE.close)
+
+# LRU cache of LLM responses keyed by normalized prompt hash
+RESPONSE_CACHE_SIZE = 10_000
+_RESPONSE_CACHE = OrderedDict()
+_RESPONSE_CACHE_LOCK = threading.Lock()
+
+# Background reading jobs for /generate-reading/full. Status and result live in an on-disk
+# store shared by every worker process, so a poll can land on any worker; entries are never
+# evicted for size, only expired once they are an hour old.
+JOB_TTL_SECONDS = 3600
+# Jobs run on the submitting worker's pool, so a job still pending after this long was lost with
+# its worker (restart or crash) and is reported as failed
+JOB_DEADLINE_SECONDS = float(os.getenv("JOB_DEADLINE_SECONDS", "120"))
+_JOB_POOL = ThreadPoolExecutor(max_workers=8, thread_name_prefix="reading-job")
+_JOB_STORE = Cache(os.getenv("JOB_STORE_DIR", os.path.join(tempfile.gettempdir(), "astrologer-jobs")),
+                   eviction_policy='none')
+atexit.register(_JOB_STORE.close)
+
+# Calls currently in flight, keyed by what they fetch, so identical concurrent requests share one upstream call
+_INFLIGHT = {}
+_INFLIGHT_LOCK = threading.Lock()
+
+# Pre-written per-sign readings served when Groq is failing; "{name}" is filled per request
+with open(os.path.join(os.path.dirname(os.path.abspath(__file__)), "zodiac_fallbacks.json"), "rb") as f:
+    ZODIAC_FALLBACKS = orjson.loads(f.read())
 
 # Model to use (options: "llama3-8b-8192", "mixtral-8x7b-32768", "gemma-7b-it")
 MODEL_NAME = "llama3-8b-8192"
 
+# ------------------- Concurrency Utils -------------------
+
+def _singleflight(key, fn, *args):
+    """Run fn(*args) once per key at a time; concurrent callers with the same key share its outcome"""
+    with _INFLIGHT_LOCK:
+        future = _INFLIGHT.get(key)
+        leader = future is None
+        if leader:
+            future = Future()
+            _INFLIGHT[key] = future
+    if not leader:
+        return future.result()
+
+    try:
+        result = fn(*args)
+    except BaseException as e:
+        future.set_exception(e)
+        raise
+    else:
+        future.set_result(result)
+        return result
+    finally:
+        with _INFLIGHT_LOCK:
+            _INFLIGHT.pop(key, None)
+
 # ------------------- Astrology Utils -------------------
 
+# Zodiac lookup table indexed by day of a leap reference year, so Feb 29 has its own slot
+_ZODIAC_NAMES = (
+    "Capricorn", "Aquarius", "Pisces", "Aries", "Taurus", "Gemini",
+    "Cancer", "Leo", "Virgo", "Libra", "Scorpio", "Sagittarius"
+)
+_MONTH_OFFSETS = (0, 0, 31, 60, 91, 121, 152, 182, 213, 244, 274, 305, 335)
+
+def _build_zodiac_lut():
+    """Map each (month, day) ordinal to an index into _ZODIAC_NAMES"""
+    sign_starts = [
+        (1, 20, 1), (2, 19, 2), (3, 21, 3), (4, 20, 4), (5, 21, 5), (6, 21, 6),
+        (7, 23, 7), (8, 23, 8), (9, 23, 9), (10, 23, 10), (11, 22, 11), (12, 22, 0)
+    ]
+    lut = bytearray(367)  # Jan 1-19 stay Capricorn
+    for month, day, index in sign_starts:
+        start = _MONTH_OFFSETS[month] + day
+        lut[start:] = bytes([index]) * (367 - start)
+    return bytes(lut)
+
+_ZODIAC_BY_DAY = _build_zodiac_lut()
+
+# Short generic blurbs served instantly while the personalized reading is generated
+ZODIAC_BLURBS = {
+    "Aries": "Bold and pioneering, Aries charges ahead with courage, energy and a love of new beginnings.",
+    "Taurus": "Grounded and loyal, Taurus builds steadily, savoring comfort, beauty and lasting security.",
+    "Gemini": "Curious and quick-witted, Gemini thrives on ideas, conversation and constant variety.",
+    "Cancer": "Nurturing and intuitive, Cancer protects its loved ones and feels the world deeply.",
+    "Leo": "Warm-hearted and radiant, Leo leads with generosity, creativity and a flair for the dramatic.",
+    "Virgo": "Thoughtful and precise, Virgo finds meaning in service, craft and getting the details right.",
+    "Libra": "Gracious and fair-minded, Libra seeks harmony, partnership and balance in all things.",
+    "Scorpio": "Intense and perceptive, Scorpio pursues depth, truth and transformation without compromise.",
+    "Sagittarius": "Adventurous and optimistic, Sagittarius chases wisdom, freedom and far horizons.",
+    "Capricorn": "Disciplined and ambitious, Capricorn climbs patiently toward goals that stand the test of time.",
+    "Aquarius": "Inventive and independent, Aquarius dreams up the future and champions the collective.",
+    "Pisces": "Compassionate and imaginative, Pisces flows with empathy, artistry and spiritual insight."
+}
+
 def get_zodiac_sign(birth_date):
     """Determine zodiac sign from birth date"""
-    month, day = birth_date.month, birth_date.day
-    zodiac_signs = [
-        (3, 21, "Aries"), (4, 20, "Taurus"), (5, 21, "Gemini"),
-        (6, 21, "Cancer"), (7, 23, "Leo"), (8, 23, "Virgo"),
-        (9, 23, "Libra"), (10, 23, "Scorpio"), (11, 22, "Sagittarius"),
-        (12, 22, "Capricorn"), (1, 20, "Aquarius"), (2, 19, "Pisces")
-    ]
-    for start_month, start_day, sign in zodiac_signs:
-        if month == start_month and day >= start_day:
-            return sign
-        elif month == (start_month % 12) + 1 and day < start_day:
-            return sign
-    return "Capricorn"  # fallback
+    return _ZODIAC_NAMES[_ZODIAC_BY_DAY[_MONTH_OFFSETS[birth_date.month] + birth_date.day]]
+
+_ISO_DATE_RE = re.compile(r"\d{4}-\d{2}-\d{2}")
+
+@lru_cache(maxsize=4096)
+def _parse_iso(date_string):
+    """Parse a YYYY-MM-DD birth date; cached because the same birthdays recur"""
+    if not _ISO_DATE_RE.fullmatch(date_string):
+        raise ValueError("expected a YYYY-MM-DD date")
+    return date.fromisoformat(date_string)
+
+def _tavily_call(query, include_answer=False):
+    """Run a single Tavily search and return its top results, plus Tavily's summary if requested"""
+    cache_key = (query, include_answer)
+    cached = _TAVILY_CACHE.get(cache_key)
+    if cached is not None:
+        return cached
+
+    tavily_url = "https://api.tavily.com/search"
+    payload = {
+        "api_key": TAVILY_API_KEY,
+        "query": query,
+        "search_depth": "basic",
+        "include_answer": include_answer,
+        "max_results": 2
+    }
+    results = []
+    try:
+        response = _SESSION.post(tavily_url, json=payload, timeout=TAVILY_TIMEOUT)
+        if response.status_code == 200:
+            data = response.json()
+            if 'results' in data:
+                results.extend(data['results'][:2])
+            if 'answer' in data and data['answer']:
+                results.append({'content': data['answer'], 'title': f'Summary for {query}'})
+            _TAVILY_CACHE.set(cache_key, results, expire=TAVILY_CACHE_TTL)
+    except requests.RequestException as e:
+        logger.warning(f"Tavily search failed for query '{query}': {e}")
+    return results
 
 def search_astrology_info(birth_data):
     """Use Tavily API to search for astrology information"""
     try:
-        birth_date = datetime.strptime(birth_data['birthDate'], '%Y-%m-%d')
-        today = datetime.now()
-        age = today.year - birth_date.year - ((today.month, today.day) < (birth_date.month, birth_date.day))
-        zodiac_sign = get_zodiac_sign(birth_date)
+        zodiac_sign = get_zodiac_sign(birth_data['birthDate'])
 
         search_queries = [
             f"{zodiac_sign} astrology personality traits characteristics",
             f"{zodiac_sign} horoscope career love relationships",
             f"birth chart astrology {birth_data['birthPlace']} {birth_data['birthDate']}"
         ]
+        # Tavily's generated summary only adds signal for the birthplace-specific query
+        include_answers = [False, False, True]
+
+        trait_results, love_results, chart_results = _TAVILY_POOL.map(
+            _tavily_call, search_queries, include_answers)
+        sign_results = trait_results + love_results
 
-        all_results = []
-        for query in search_queries:
-            tavily_url = "https://api.tavily.com/search"
-            payload = {
-                "api_key": TAVILY_API_KEY,
-                "query": query,
-                "search_depth": "basic",
-                "include_answer": True,
-                "max_results": 3
-            }
-            try:
-                response = requests.post(tavily_url, json=payload, timeout=30)
-                if response.status_code == 200:
-                    data = response.json()
-                    if 'results' in data:
-                        all_results.extend(data['results'][:2])
-                    if 'answer' in data and data['answer']:
-                        all_results.append({'content': data['answer'], 'title': f'Summary for {query}'})
-            except requests.RequestException as e:
-                logger.warning(f"Tavily search failed for query '{query}': {e}")
-                continue
-
-        return {'zodiac_sign': zodiac_sign, 'age': age, 'search_results': all_results}
+        return {'zodiac_sign': zodiac_sign,
+                'sign_results': sign_results, 'chart_results': chart_results}
     except Exception as e:
         logger.error(f"Error in search_astrology_info: {e}")
         return None
 
 # ------------------- Groq LLM -------------------
 
-def generate_response_with_llm(prompt):
-    """Generate response using Groq API"""
+_groq_warmed = threading.Event()
+_GROQ_WARMUP_LOCK = threading.Lock()
+
+# The warm-up only opens a connection, so it fails fast instead of using the client's retries and timeout
+_groq_warmup_client = groq_client.with_options(timeout=httpx.Timeout(3.0), max_retries=0)
+
+LLM_UNAVAILABLE_MESSAGE = "I'm having trouble accessing my astrological insights right now. Please try again later."
+
+class CircuitBreaker:
+    """Skip calls to a failing upstream for reset_timeout seconds after fail_max consecutive failures"""
+
+    def __init__(self, fail_max=5, reset_timeout=60):
+        self.fail_max = fail_max
+        self.reset_timeout = reset_timeout
+        self._failures = 0
+        self._opened_at = None
+        self._lock = threading.Lock()
+
+    def allow(self):
+        with self._lock:
+            if self._opened_at is None:
+                return True
+            if time.monotonic() - self._opened_at < self.reset_timeout:
+                return False
+            # Half-open: let calls through again, but a single failure re-opens the breaker
+            self._opened_at = None
+            self._failures = self.fail_max - 1
+            return True
+
+    def is_open(self):
+        """Whether calls are currently being skipped, without starting a half-open trial"""
+        with self._lock:
+            return self._opened_at is not None and time.monotonic() - self._opened_at < self.reset_timeout
+
+    def record_success(self):
+        with self._lock:
+            self._failures = 0
+            self._opened_at = None
+
+    def record_failure(self):
+        with self._lock:
+            self._failures += 1
+            if self._failures >= self.fail_max and self._opened_at is None:
+                self._opened_at = time.monotonic()
+                logger.warning(f"Groq circuit breaker opened for {self.reset_timeout}s")
+
+_GROQ_BREAKER = CircuitBreaker(fail_max=5, reset_timeout=60)
+
+_DURATION_PART_RE = re.compile(r"(\d+(?:\.\d+)?)(ms|h|m|s)")
+_DURATION_UNITS = {"ms": 0.001, "s": 1, "m": 60, "h": 3600}
+
+def _parse_duration(value):
+    """Parse rate-limit reset durations such as "2m59.56s" or "450ms" into seconds"""
+    parts = _DURATION_PART_RE.findall(value or "")
+    if not parts:
+        return None
+    return sum(float(amount) * _DURATION_UNITS[unit] for amount, unit in parts)
+
+class RateLimitPacer:
+    """Spread calls across the provider's reset window once its remaining-request budget runs low"""
+
+    def __init__(self, low_water=10, max_delay=10.0):
+        self.low_water = low_water
+        self.max_delay = max_delay
+        self._interval = 0.0
+        self._next_at = 0.0
+        self._lock = threading.Lock()
+
+    def wait(self):
+        with self._lock:
+            now = time.monotonic()
+            delay = min(max(self._next_at - now, 0.0), self.max_delay)
+            # Never book the next slot past max_delay, or waits pile up beyond what is ever slept
+            self._next_at = min(now + delay + self._interval, now + self.max_delay)
+        if delay > 0:
+            time.sleep(delay)
+
+    def update(self, headers):
+        try:
+            remaining = int(headers.get("x-ratelimit-remaining-requests"))
+        except (TypeError, ValueError):
+            return
+        reset = _parse_duration(headers.get("x-ratelimit-reset-requests"))
+        with self._lock:
+            if remaining > self.low_water or reset is None:
+                self._interval = 0.0
+                self._next_at = 0.0
+            else:
+                self._interval = reset / (remaining + 1)
+
+_GROQ_PACER = RateLimitPacer(low_water=int(os.getenv("GROQ_RATELIMIT_LOW_WATER", "10")))
+
+SYSTEM_PROMPT = "You are an expert astrologer."
+
+def _prompt_key(system_prompt, prompt):
+    """Hash a prompt after folding case and whitespace so trivial variants share a key"""
+    normalized = " ".join(f"{system_prompt}\n{prompt}".lower().split())
+    return hashlib.blake2b(normalized.encode(), digest_size=16).hexdigest()
+
+def _cache_get(key):
+    with _RESPONSE_CACHE_LOCK:
+        response = _RESPONSE_CACHE.get(key)
+        if response is not None:
+            _RESPONSE_CACHE.move_to_end(key)
+        return response
+
+def _cache_put(key, response):
+    with _RESPONSE_CACHE_LOCK:
+        _RESPONSE_CACHE[key] = response
+        _RESPONSE_CACHE.move_to_end(key)
+        while len(_RESPONSE_CACHE) > RESPONSE_CACHE_SIZE:
+            _RESPONSE_CACHE.popitem(last=False)
+
+def _completion_args(prompt, system_prompt=SYSTEM_PROMPT, max_tokens=800, json_mode=False):
+    """Groq chat completion arguments shared by the blocking and streaming paths"""
+    args = {
+        "model": MODEL_NAME,
+        "messages": [
+            {"role": "system", "content": system_prompt},
+            {"role": "user", "content": prompt},
+        ],
+        "temperature": 0.7,
+        "max_tokens": max_tokens,
+        "top_p": 0.9
+    }
+    if json_mode:
+        args["response_format"] = {"type": "json_object"}
+    return args
+
+class LLMUnavailableError(Exception):
+    """Raised when Groq can't produce a response (circuit open or the call failed)"""
+
+def generate_response_with_llm(prompt, system_prompt=SYSTEM_PROMPT, max_tokens=800, json_mode=False,
+                               fallback=None):
+    """Generate response using Groq API, serving repeated prompts from cache.
+
+    When a fallback is given the call runs on the reading latency budget, and the fallback
+    is returned while Groq is failing or slow (otherwise an apology is returned).
+    """
     if not GROQ_API_KEY:
         return "Sorry, Groq API is not configured."
 
+    client = _groq_reading_client if fallback else groq_client
     try:
-        response = groq_client.chat.completions.create(
-            model=MODEL_NAME,
-            messages=[
-                {"role": "system", "content": "You are an expert astrologer."},
-                {"role": "user", "content": prompt},
-            ],
-            temperature=0.7,
-            max_tokens=800,
-            top_p=0.9
-        )
-        # FIX: use .content instead of dict subscript
-        return response.choices[0].message.content.strip()
+        return _llm_text(prompt, system_prompt, max_tokens, json_mode, client)
+    except LLMUnavailableError:
+        if fallback:
+            logger.warning("Serving fallback response after Groq error")
+        return fallback or LLM_UNAVAILABLE_MESSAGE
+
+def _llm_text(prompt, system_prompt, max_tokens, json_mode, client):
+    """Return Groq's response text from cache or a (coalesced) call; raises LLMUnavailableError"""
+    key = _prompt_key(system_prompt, prompt)
+    cached = _cache_get(key)
+    if cached is not None:
+        logger.info("Serving LLM response from cache")
+        return cached
+
+    if not _GROQ_BREAKER.allow():
+        logger.warning("Groq circuit open, skipping call")
+        raise LLMUnavailableError("circuit open")
+
+    try:
+        return _singleflight(("llm", key), _complete, key, prompt, system_prompt, max_tokens, json_mode, client)
     except Exception as e:
         logger.error(f"Error calling Groq API: {e}")
-        return "I'm having trouble accessing my astrological insights right now. Please try again later."
+        raise LLMUnavailableError(str(e)) from e
+
+def _record_latency(elapsed):
+    """Feed a successful call into the breaker, counting slow calls as failures"""
+    if elapsed > GROQ_SLOW_SECONDS:
+        logger.warning(f"Groq call took {elapsed:.1f}s, counting it as degraded")
+        _GROQ_BREAKER.record_failure()
+    else:
+        _GROQ_BREAKER.record_success()
+
+# Failures that say Groq itself is unhealthy (timeouts, network errors, 429, 5xx). Rejections of a
+# particular request (other 4xx) don't, so they leave the breaker alone. Errors raised while reading
+# a stream come straight from httpx.
+_BREAKER_ERRORS = (APIConnectionError, RateLimitError, InternalServerError, httpx.TransportError)
+
+def _record_error(error):
+    """Feed a failed call into the breaker, and its rate-limit headers (e.g. on a 429) into the pacer"""
+    if isinstance(error, APIStatusError):
+        _GROQ_PACER.update(error.response.headers)
+    if isinstance(error, _BREAKER_ERRORS):
+        _GROQ_BREAKER.record_failure()
+
+def _complete(key, prompt, system_prompt, max_tokens, json_mode, client):
+    """Call Groq once, updating the circuit breaker and response cache"""
+    _GROQ_PACER.wait()
+    try:
+        with _GROQ_SEM:
+            # Timed from slot acquisition so queueing behind local concurrency isn't blamed on Groq
+            started = time.monotonic()
+            raw = client.chat.completions.with_raw_response.create(
+                **_completion_args(prompt, system_prompt, max_tokens=max_tokens, json_mode=json_mode))
+            elapsed = time.monotonic() - started
+        _GROQ_PACER.update(raw.headers)
+        response = raw.parse()
+        # FIX: use .content instead of dict subscript
+        text = response.choices[0].message.content.strip()
+    except Exception as e:
+        _record_error(e)
+        raise
+
+    _record_latency(elapsed)
+    _cache_put(key, text)
+    return text
+
+class StreamInterrupted(Exception):
+    """Raised by stream_response_with_llm when Groq fails after some chunks were already sent"""
+
+    def __init__(self, fallback=None):
+        super().__init__("Groq stream interrupted")
+        self.fallback = fallback
+
+def stream_response_with_llm(prompt, system_prompt=SYSTEM_PROMPT, fallback=None):
+    """Yield the Groq response in chunks as they are generated.
+
+    Raises StreamInterrupted if the stream fails partway through.
+    """
+    if not GROQ_API_KEY:
+        yield "Sorry, Groq API is not configured."
+        return
+
+    key = _prompt_key(system_prompt, prompt)
+    cached = _cache_get(key)
+    if cached is not None:
+        logger.info("Serving LLM response from cache")
+        yield cached
+        return
+
+    if not _GROQ_BREAKER.allow():
+        logger.warning("Groq circuit open, serving fallback response")
+        yield fallback or LLM_UNAVAILABLE_MESSAGE
+        return
+
+    # Groq is drained on a separate thread so the concurrency slot is released as soon as
+    # generation ends, not when a slow SSE client finishes reading
+    out = queue.Queue()  # bounded in practice by max_tokens
+    client = _groq_reading_client if fallback else groq_client
+    threading.Thread(target=_drain_stream, args=(key, prompt, system_prompt, client, out),
+                     name="groq-stream", daemon=True).start()
+
+    streamed = False
+    while True:
+        item = out.get()
+        if item is _STREAM_END:
+            return
+        if isinstance(item, Exception):
+            logger.error(f"Error streaming from Groq API: {item}")
+            if streamed:
+                raise StreamInterrupted(fallback)
+            if fallback:
+                logger.warning("Serving fallback response after Groq error")
+            yield fallback or LLM_UNAVAILABLE_MESSAGE
+            return
+        streamed = True
+        yield item
+
+_STREAM_END = object()
+
+def _drain_stream(key, prompt, system_prompt, client, out):
+    """Read a Groq stream to completion into out while holding a concurrency slot"""
+    chunks = []
+    _GROQ_PACER.wait()
+    first_token_after = None
+    try:
+        with _GROQ_SEM:
+            started = time.monotonic()
+            raw = client.chat.completions.with_raw_response.create(
+                **_completion_args(prompt, system_prompt), stream=True)
+            _GROQ_PACER.update(raw.headers)
+            for chunk in raw.parse():
+                delta = chunk.choices[0].delta.content or ""
+                if delta:
+                    if first_token_after is None:
+                        first_token_after = time.monotonic() - started
+                    chunks.append(delta)
+                    out.put(delta)
+    except Exception as e:
+        _record_error(e)
+        out.put(e)
+        return
+
+    _record_latency(first_token_after or 0.0)
+    _cache_put(key, "".join(chunks).strip())
+    out.put(_STREAM_END)
+
+def _warm_groq_connection():
+    """Open the Groq HTTP connection once so the first completion skips the handshake.
+
+    Only one warm-up runs at a time; concurrent callers return immediately.
+    """
+    if _groq_warmed.is_set() or not GROQ_API_KEY or not _GROQ_WARMUP_LOCK.acquire(blocking=False):
+        return
+    try:
+        _groq_warmup_client.models.list()
+        _groq_warmed.set()
+    except Exception as e:
+        logger.warning(f"Groq connection warm-up failed: {e}")
+    finally:
+        _GROQ_WARMUP_LOCK.release()
+
+def _warm_tavily_connection():
+    """Open a pooled TLS connection to Tavily ahead of the first search"""
+    if not TAVILY_API_KEY:
+        return
+    try:
+        _SESSION.head("https://api.tavily.com", timeout=TAVILY_TIMEOUT)
+    except requests.RequestException as e:
+        logger.warning(f"Tavily connection warm-up failed: {e}")
+
+def _warm_connections():
+    _warm_groq_connection()
+    _warm_tavily_connection()
+
+def fetch_search_info(birth_data):
+    """Run the Tavily search, retrying the Groq warm-up in the background if it hasn't succeeded yet"""
+    if GROQ_API_KEY and not (_groq_warmed.is_set() or _GROQ_WARMUP_LOCK.locked() or _GROQ_BREAKER.is_open()):
+        threading.Thread(target=_warm_groq_connection, name="warmup", daemon=True).start()
+    search_key = ("search", birth_data['birthDate'], birth_data['birthPlace'])
+    return _singleflight(search_key, search_astrology_info, birth_data)
+
+# Warm upstream connections at startup (per worker process) without delaying boot
+threading.Thread(target=_warm_connections, name="warmup", daemon=True).start()
 
 # ------------------- Reading Generators -------------------
 
-def create_astrology_reading(birth_data, search_info):
-    """Create personalized astrology reading"""
-    context = ""
-    if search_info and 'search_results' in search_info:
-        for result in search_info['search_results'][:5]:
-            if 'content' in result:
-                context += f"{result['content']}\n"
+_WHITESPACE_RE = re.compile(r"\s+")
+
+# Sign-level background goes in the system message: it is identical for every request with the
+# same zodiac sign, so it forms a shared prompt prefix the provider can reuse across requests.
+SIGN_CONTEXT_CHARS = 1200
 
-    prompt = f"""Create a personalized astrology reading for:
+_SYSTEM_TEMPLATE = """You are an expert astrologer.
 
-Name: {birth_data['name']}
-Birth Date: {birth_data['birthDate']}
-Birth Time: {birth_data['birthTime']}
-Birth Place: {birth_data['birthPlace']}
-Zodiac Sign: {search_info['zodiac_sign'] if search_info else 'Unknown'}
+Background on {zodiac_sign}:
+{sign_context}"""
 
-Astrological context:
+_READING_TEMPLATE = """Create a personalized astrology reading for:
+
+Name: {name}
+Birth Date: {birthDate}
+Birth Time: {birthTime}
+Birth Place: {birthPlace}
+Zodiac Sign: {zodiac_sign}
+
+Birth chart notes:
 {context}
 
 Please provide ~300–400 words covering:
@@ -137,79 +621,353 @@ Please provide ~300–400 words covering:
 5. A brief outlook for the current period
 
 Tone: warm, personal, insightful."""
-    return generate_response_with_llm(prompt)
-
-def answer_astrology_question(birth_data, question, search_info):
-    """Answer specific astrology question"""
-    context = ""
-    if search_info and 'search_results' in search_info:
-        for result in search_info['search_results'][:3]:
-            if 'content' in result:
-                context += f"{result['content']}\n"
 
-    prompt = f"""Answer this astrology question for:
+_QUESTION_TEMPLATE = """Answer this astrology question for:
 
-Name: {birth_data['name']}
-Birth Date: {birth_data['birthDate']}
-Birth Time: {birth_data['birthTime']}
-Birth Place: {birth_data['birthPlace']}
-Zodiac Sign: {search_info['zodiac_sign'] if search_info else 'Unknown'}
+Name: {name}
+Birth Date: {birthDate}
+Birth Time: {birthTime}
+Birth Place: {birthPlace}
+Zodiac Sign: {zodiac_sign}
 
 Question: {question}
 
-Astrological context:
+Birth chart notes:
 {context}
 
 Provide 150–250 words, personal, thoughtful, and practical."""
-    return generate_response_with_llm(prompt)
+
+_BUNDLE_TEMPLATE = """Create a personalized astrology reading and answer a question for:
+
+Name: {name}
+Birth Date: {birthDate}
+Birth Time: {birthTime}
+Birth Place: {birthPlace}
+Zodiac Sign: {zodiac_sign}
+
+Question: {question}
+
+Birth chart notes:
+{context}
+
+Respond as JSON: {{"reading": "...", "answer": "..."}}
+- "reading": ~300–400 words covering personality traits, strengths and challenges, career and life path,
+  relationships and compatibility, and a brief outlook for the current period. Tone: warm, personal, insightful.
+- "answer": 150–250 words answering the question, personal, thoughtful, and practical."""
+
+def _pack_context(results, max_chars=2000):
+    """Join deduplicated, whitespace-normalized search snippets up to max_chars"""
+    seen = set()
+    parts = []
+    remaining = max_chars
+    for result in results:
+        content = result.get('content')
+        if not content:
+            continue
+        content = _WHITESPACE_RE.sub(" ", content).strip()
+        fingerprint = content[:200].lower()
+        if fingerprint in seen:
+            continue
+        seen.add(fingerprint)
+
+        snippet = content[:remaining]
+        parts.append(snippet)
+        remaining -= len(snippet) + 1
+        if remaining <= 0:
+            break
+    return "\n".join(parts)
+
+def _prompt_parts(search_info, chart_chars):
+    """Split search info into the per-sign system prompt and the user-specific chart context"""
+    if not search_info:
+        return SYSTEM_PROMPT, ""
+    system_prompt = _SYSTEM_TEMPLATE.format(
+        zodiac_sign=search_info['zodiac_sign'],
+        sign_context=_pack_context(search_info['sign_results'], SIGN_CONTEXT_CHARS))
+    return system_prompt, _pack_context(search_info['chart_results'], chart_chars)
+
+def _fallback_reading(birth_data, search_info):
+    """Pre-written reading for the user's sign, used when Groq is unavailable"""
+    if not search_info:
+        return None
+    return ZODIAC_FALLBACKS[search_info['zodiac_sign']].format_map({'name': birth_data['name']})
+
+def create_astrology_reading(birth_data, search_info, stream=False):
+    """Create personalized astrology reading (a chunk generator when stream=True)"""
+    system_prompt, context = _prompt_parts(search_info, chart_chars=800)
+    fallback = _fallback_reading(birth_data, search_info)
+
+    prompt = _READING_TEMPLATE.format_map(birth_data | {
+        'zodiac_sign': search_info['zodiac_sign'] if search_info else 'Unknown',
+        'context': context
+    })
+    if stream:
+        return stream_response_with_llm(prompt, system_prompt, fallback=fallback)
+    return generate_response_with_llm(prompt, system_prompt, fallback=fallback)
+
+def answer_astrology_question(birth_data, question, search_info, stream=False):
+    """Answer specific astrology question (a chunk generator when stream=True)"""
+    system_prompt, context = _prompt_parts(search_info, chart_chars=400)
+
+    prompt = _QUESTION_TEMPLATE.format_map(birth_data | {
+        'zodiac_sign': search_info['zodiac_sign'] if search_info else 'Unknown',
+        'question': question,
+        'context': context
+    })
+    if stream:
+        return stream_response_with_llm(prompt, system_prompt)
+    return generate_response_with_llm(prompt, system_prompt)
+
+def create_reading_bundle(birth_data, question, search_info):
+    """Generate a reading and a question answer from a single Groq call"""
+    system_prompt, context = _prompt_parts(search_info, chart_chars=800)
+
+    prompt = _BUNDLE_TEMPLATE.format_map(birth_data | {
+        'zodiac_sign': search_info['zodiac_sign'] if search_info else 'Unknown',
+        'question': question,
+        'context': context
+    })
+    try:
+        bundle = orjson.loads(_llm_text(prompt, system_prompt, 1500, True, _groq_reading_client))
+        if isinstance(bundle.get('reading'), str) and isinstance(bundle.get('answer'), str):
+            return bundle['reading'].strip(), bundle['answer'].strip()
+    except LLMUnavailableError as e:
+        # Groq rejects JSON-mode output that fails to validate with a 400; only that is worth retrying
+        if not isinstance(e.__cause__, BadRequestError):
+            return _fallback_reading(birth_data, search_info) or LLM_UNAVAILABLE_MESSAGE, LLM_UNAVAILABLE_MESSAGE
+    except (ValueError, AttributeError):
+        pass
+
+    logger.warning("Bundle response was not valid JSON, falling back to separate calls")
+    return (create_astrology_reading(birth_data, search_info),
+            answer_astrology_question(birth_data, question, search_info))
+
+def _sse_stream(chunks, **meta):
+    """Wrap text chunks as server-sent events: one meta event, tokens, then done (or error)"""
+    yield f"event: meta\ndata: {orjson.dumps(meta).decode()}\n\n"
+    try:
+        for chunk in chunks:
+            yield f"data: {orjson.dumps({'token': chunk}).decode()}\n\n"
+    except StreamInterrupted as e:
+        error = {'error': 'The response was interrupted. Please try again.', 'fallback': e.fallback}
+        yield f"event: error\ndata: {orjson.dumps(error).decode()}\n\n"
+        return
+    yield "event: done\ndata: {}\n\n"
+
+def _sse_response(events):
+    return Response(stream_with_context(events), mimetype='text/event-stream',
+                    headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+
+def _run_reading_job(job_id, birth_data):
+    """Produce a full reading for a background job and record the outcome in the job store"""
+    try:
+        search_info = fetch_search_info(birth_data)
+        reading = create_astrology_reading(birth_data, search_info)
+        job = {'status': 'done', 'reading': reading,
+               'zodiac_sign': search_info['zodiac_sign'] if search_info else None}
+    except Exception as e:
+        logger.error(f"Reading job {job_id} failed: {e}")
+        job = {'status': 'failed'}
+    _JOB_STORE.set(job_id, job, expire=JOB_TTL_SECONDS)
+
+# ------------------- Request Models -------------------
+
+NonEmptyStr = Annotated[str, StringConstraints(strip_whitespace=True, min_length=1)]
+
+def _iso_date(value):
+    """Accept only YYYY-MM-DD strings, so numbers and other date spellings are rejected"""
+    if not isinstance(value, str):
+        raise ValueError("expected a YYYY-MM-DD string")
+    return _parse_iso(value)
+
+IsoDate = Annotated[date, BeforeValidator(_iso_date)]
+
+class BirthData(BaseModel):
+    name: NonEmptyStr
+    birthDate: IsoDate
+    birthTime: NonEmptyStr
+    birthPlace: NonEmptyStr
+
+    def birth_dict(self):
+        """Plain dict of the birth fields; birthDate stays a date (it renders as YYYY-MM-DD)"""
+        return self.model_dump(include=set(BirthData.model_fields))
+
+class QuestionRequest(BirthData):
+    question: NonEmptyStr
+
+class BundleRequest(BirthData):
+    question: Optional[str] = None
+
+class ZodiacRequest(BaseModel):
+    birthDate: IsoDate
+
+def _validation_message(error):
+    """Turn the first pydantic error into the API's 400 message"""
+    first = error.errors()[0]
+    if not first['loc']:
+        return 'Request body must be a JSON object'
+    field = first['loc'][0]
+    if first['type'] in ('missing', 'string_too_short') or first.get('input') is None:
+        return 'Question is required' if field == 'question' else f'Missing required field: {field}'
+    return f"Invalid {field}: {first['msg']}"
+
+def _jsonify(payload):
+    return Response(orjson.dumps(payload), mimetype='application/json')
+
+def _parse_body(model):
+    """Parse and validate the JSON body; returns (parsed, None) or (None, error response)"""
+    try:
+        return model.model_validate(orjson.loads(request.get_data())), None
+    except orjson.JSONDecodeError:
+        return None, (_jsonify({'success': False, 'error': 'Invalid JSON body'}), 400)
+    except ValidationError as e:
+        return None, (_jsonify({'success': False, 'error': _validation_message(e)}), 400)
 
 # ------------------- Routes -------------------
 
 @app.route('/generate-reading', methods=['POST'])
 def generate_reading():
     try:
-        birth_data = request.json
-        required_fields = ['name', 'birthDate', 'birthTime', 'birthPlace']
-        for field in required_fields:
-            if not birth_data.get(field):
-                return jsonify({'success': False, 'error': f'Missing required field: {field}'}), 400
+        body, error = _parse_body(BirthData)
+        if error:
+            return error
+        birth_data = body.birth_dict()
 
         logger.info(f"Generating reading for {birth_data['name']}")
-        search_info = search_astrology_info(birth_data)
+        search_info = fetch_search_info(birth_data)
         reading = create_astrology_reading(birth_data, search_info)
 
-        return jsonify({'success': True, 'reading': reading,
+        return _jsonify({'success': True, 'reading': reading,
                         'zodiac_sign': search_info['zodiac_sign'] if search_info else None})
     except Exception as e:
         logger.error(f"Error in generate_reading: {e}")
-        return jsonify({'success': False, 'error': 'Internal server error'}), 500
+        return _jsonify({'success': False, 'error': 'Internal server error'}), 500
 
 @app.route('/ask-question', methods=['POST'])
 def ask_question():
     try:
-        data = request.json
-        birth_data = {
-            'name': data.get('name'),
-            'birthDate': data.get('birthDate'),
-            'birthTime': data.get('birthTime'),
-            'birthPlace': data.get('birthPlace')
-        }
-        question = data.get('question')
-        if not question:
-            return jsonify({'success': False, 'error': 'Question is required'}), 400
+        body, error = _parse_body(QuestionRequest)
+        if error:
+            return error
+        birth_data, question = body.birth_dict(), body.question
 
         logger.info(f"Answering question for {birth_data['name']}: {question}")
-        search_info = search_astrology_info(birth_data)
+        search_info = fetch_search_info(birth_data)
         answer = answer_astrology_question(birth_data, question, search_info)
 
-        return jsonify({'success': True, 'answer': answer})
+        return _jsonify({'success': True, 'answer': answer})
     except Exception as e:
         logger.error(f"Error in ask_question: {e}")
-        return jsonify({'success': False, 'error': 'Internal server error'}), 500
+        return _jsonify({'success': False, 'error': 'Internal server error'}), 500
+
+@app.route('/generate-reading/stream', methods=['POST'])
+def generate_reading_stream():
+    try:
+        body, error = _parse_body(BirthData)
+        if error:
+            return error
+        birth_data = body.birth_dict()
+
+        logger.info(f"Streaming reading for {birth_data['name']}")
+        search_info = fetch_search_info(birth_data)
+        chunks = create_astrology_reading(birth_data, search_info, stream=True)
+
+        return _sse_response(_sse_stream(
+            chunks, zodiac_sign=search_info['zodiac_sign'] if search_info else None))
+    except Exception as e:
+        logger.error(f"Error in generate_reading_stream: {e}")
+        return _jsonify({'success': False, 'error': 'Internal server error'}), 500
+
+@app.route('/ask-question/stream', methods=['POST'])
+def ask_question_stream():
+    try:
+        body, error = _parse_body(QuestionRequest)
+        if error:
+            return error
+        birth_data, question = body.birth_dict(), body.question
+
+        logger.info(f"Streaming answer for {birth_data['name']}: {question}")
+        search_info = fetch_search_info(birth_data)
+        chunks = answer_astrology_question(birth_data, question, search_info, stream=True)
+
+        return _sse_response(_sse_stream(chunks))
+    except Exception as e:
+        logger.error(f"Error in ask_question_stream: {e}")
+        return _jsonify({'success': False, 'error': 'Internal server error'}), 500
+
+@app.route('/generate-bundle', methods=['POST'])
+def generate_bundle():
+    try:
+        body, error = _parse_body(BundleRequest)
+        if error:
+            return error
+        birth_data = body.birth_dict()
+        question = body.question.strip() if body.question else None
+        logger.info(f"Generating bundle for {birth_data['name']}")
+        search_info = fetch_search_info(birth_data)
+        if question:
+            reading, answer = create_reading_bundle(birth_data, question, search_info)
+        else:
+            reading, answer = create_astrology_reading(birth_data, search_info), None
+
+        return _jsonify({'success': True, 'reading': reading, 'answer': answer,
+                        'zodiac_sign': search_info['zodiac_sign'] if search_info else None})
+    except Exception as e:
+        logger.error(f"Error in generate_bundle: {e}")
+        return _jsonify({'success': False, 'error': 'Internal server error'}), 500
+
+@app.route('/generate-reading/instant', methods=['POST'])
+def generate_reading_instant():
+    try:
+        body, error = _parse_body(ZodiacRequest)
+        if error:
+            return error
+        zodiac_sign = get_zodiac_sign(body.birthDate)
+
+        return _jsonify({'success': True, 'zodiac_sign': zodiac_sign,
+                        'generic_blurb': ZODIAC_BLURBS[zodiac_sign]})
+    except Exception as e:
+        logger.error(f"Error in generate_reading_instant: {e}")
+        return _jsonify({'success': False, 'error': 'Internal server error'}), 500
+
+@app.route('/generate-reading/full', methods=['POST'])
+def generate_reading_full():
+    try:
+        body, error = _parse_body(BirthData)
+        if error:
+            return error
+        birth_data = body.birth_dict()
+
+        logger.info(f"Queueing reading job for {birth_data['name']}")
+        job_id = uuid.uuid4().hex
+        _JOB_STORE.set(job_id, {'status': 'pending', 'started': time.time(), 'pid': os.getpid()},
+                       expire=JOB_TTL_SECONDS)
+        _JOB_POOL.submit(_run_reading_job, job_id, birth_data)
+        _JOB_STORE.expire()
+
+        return _jsonify({'success': True, 'job_id': job_id, 'status': 'pending'}), 202
+    except Exception as e:
+        logger.error(f"Error in generate_reading_full: {e}")
+        return _jsonify({'success': False, 'error': 'Internal server error'}), 500
+
+@app.route('/generate-reading/status/<job_id>', methods=['GET'])
+def generate_reading_status(job_id):
+    job = _JOB_STORE.get(job_id)
+    if job is None:
+        return _jsonify({'success': False, 'error': 'Unknown or expired job'}), 404
+    if job['status'] == 'pending':
+        if time.time() - job['started'] <= JOB_DEADLINE_SECONDS:
+            return _jsonify({'success': True, 'job_id': job_id, 'status': 'pending'})
+        logger.error(f"Reading job {job_id} missed its deadline; worker {job['pid']} likely exited")
+        job = {'status': 'failed'}
+    if job['status'] == 'failed':
+        return _jsonify({'success': False, 'job_id': job_id, 'status': 'failed',
+                        'error': 'Internal server error'}), 500
+    return _jsonify({'success': True, 'job_id': job_id, **job})
 
 @app.route('/health', methods=['GET'])
 def health_check():
-    return jsonify({
+    return _jsonify({
         'status': 'healthy',
         'groq_configured': GROQ_API_KEY is not None,
         'tavily_configured': TAVILY_API_KEY is not None
@@ -222,5 +980,6 @@ if __name__ == '__main__':
     print(f"Groq API configured: {'✅' if GROQ_API_KEY else '❌'}")
     print(f"Tavily API configured: {'✅' if TAVILY_API_KEY else '❌'}")
     print("Server running on http://localhost:8000")
+    print("(development server; use `gunicorn -c gunicorn.conf.py astrologer_backend:app` in production)")
 
-    app.run(debug=True, host='0.0.0.0', port=8000)
\ No newline at end of file
+    app.run(debug=os.getenv("FLASK_DEBUG") == "1", host='0.0.0.0', port=8000, threaded=True)
\ No newline at end of file
@@ -0,0 +1,13 @@
+import os
+
+# Production server settings: gunicorn -c gunicorn.conf.py astrologer_backend:app
+bind = f"0.0.0.0:{os.getenv('PORT', '8000')}"
+workers = int(os.getenv("WEB_CONCURRENCY", "4"))
+
+# Threaded workers let each process overlap requests that block on Tavily/Groq I/O
+worker_class = "gthread"
+threads = int(os.getenv("GUNICORN_THREADS", "8"))
+
+# A reading can take several seconds of upstream LLM time
+timeout = 60
+keepalive = 5